@@ -37,16 +37,16 @@ def look_at(campos, target, opengl=True):
         up_vector = np.array([0, 1, 0], dtype=np.float32)
         right_vector = safe_normalize(np.cross(up_vector, forward_vector))
         up_vector = safe_normalize(np.cross(forward_vector, right_vector))
-    R = np.stack([right_vector, up_vector, forward_vector], axis=1)
+    R = np.stack([right_vector, up_vector, forward_vector], axis=-1)
     return R
 
 
 # elevation & azimuth to pose (cam2world) matrix
 def orbit_camera(elevation, azimuth, radius=1, is_degree=True, target=None, opengl=True):
-    # radius: scalar
-    # elevation: scalar, in (-90, 90), from +y to -y is (-90, 90)
-    # azimuth: scalar, in (-180, 180), from +z to +x is (0, 90)
-    # return: [4, 4], camera pose matrix
+    # radius: scalar or [N]
+    # elevation: scalar or [N], in (-90, 90), from +y to -y is (-90, 90)
+    # azimuth: scalar or [N], in (-180, 180), from +z to +x is (0, 90)
+    # return: [4, 4] or [N, 4, 4], camera pose matrix
     if is_degree:
         elevation = np.deg2rad(elevation)
         azimuth = np.deg2rad(azimuth)
@@ -55,10 +55,10 @@ def orbit_camera(elevation, azimuth, radius=1, is_degree=True, target=None, open
     z = radius * np.cos(elevation) * np.cos(azimuth)
     if target is None:
         target = np.zeros([3], dtype=np.float32)
-    campos = np.array([x, y, z]) + target  # [3]
-    T = np.eye(4, dtype=np.float32)
-    T[:3, :3] = look_at(campos, target, opengl)
-    T[:3, 3] = campos
+    campos = np.stack([x, y, z], axis=-1) + target  # [3] or [N, 3]
+    T = np.broadcast_to(np.eye(4, dtype=np.float32), campos.shape[:-1] + (4, 4)).copy()
+    T[..., :3, :3] = look_at(campos, target, opengl)
+    T[..., :3, 3] = campos
     return T
 
 
@@ -1,4 +1,5 @@
 import os
+import copy
 import math
 import numpy as np
 from typing import NamedTuple
@@ -367,7 +368,11 @@ class GaussianModel:
             {'params': [self._rotation], 'lr': training_args.rotation_lr, "name": "rotation"}
         ]
 
-        self.optimizer = torch.optim.Adam(l, lr=0.0, eps=1e-15)
+        try:
+            # fused adam updates all params in a single kernel (torch >= 1.13)
+            self.optimizer = torch.optim.Adam(l, lr=0.0, eps=1e-15, fused=True)
+        except TypeError:
+            self.optimizer = torch.optim.Adam(l, lr=0.0, eps=1e-15)
         self.xyz_scheduler_args = get_expon_lr_func(lr_init=training_args.position_lr_init*self.spatial_lr_scale,
                                                     lr_final=training_args.position_lr_final*self.spatial_lr_scale,
                                                     lr_delay_mult=training_args.position_lr_delay_mult,
@@ -669,6 +674,56 @@ class MiniCam:
         self.camera_center = -torch.tensor(c2w[:3, 3]).cuda()
 
 
+class CameraBatch:
+    def __init__(self, c2ws, width, height, fovy, fovx, znear, zfar):
+        # c2ws (poses) [N, 4, 4] should be in NeRF convention, numpy array or tensor.
+        # stores the same attributes as MiniCam, stacked along a leading batch dim.
+
+        self.image_width = width
+        self.image_height = height
+        self.FoVy = fovy
+        self.FoVx = fovx
+        self.znear = znear
+        self.zfar = zfar
+
+        if isinstance(c2ws, np.ndarray):
+            c2ws = torch.from_numpy(c2ws)
+        c2ws = c2ws.float().cuda()
+
+        w2cs = torch.inverse(c2ws)
+
+        # rectify...
+        w2cs[:, 1:3, :3] *= -1
+        w2cs[:, :3, 3] *= -1
+
+        self.world_view_transform = w2cs.transpose(1, 2).contiguous()
+        self.projection_matrix = (
+            getProjectionMatrix(
+                znear=self.znear, zfar=self.zfar, fovX=self.FoVx, fovY=self.FoVy
+            )
+            .transpose(0, 1)
+            .cuda()
+        )
+        self.full_proj_transform = self.world_view_transform @ self.projection_matrix
+        self.camera_center = -c2ws[:, :3, 3]
+
+    def __len__(self):
+        return self.world_view_transform.shape[0]
+
+    def __getitem__(self, i):
+        # a single view, with the same attributes as MiniCam
+        cam = copy.copy(self)
+        cam.world_view_transform = self.world_view_transform[i]
+        cam.full_proj_transform = self.full_proj_transform[i]
+        cam.camera_center = self.camera_center[i]
+        return cam
+
+    def __iter__(self):
+        # explicit, so iteration doesn't rely on the out-of-range tensor index ending the legacy protocol
+        for i in range(len(self)):
+            yield self[i]
+
+
 class Renderer:
     def __init__(self, sh_degree=3, white_background=True, radius=1):
         
@@ -818,3 +873,21 @@ class Renderer:
             "visibility_filter": radii > 0,
             "radii": radii,
         }
+
+    def render_batch(self, cameras, scaling_modifier=1.0, invert_bg_color=False):
+        # cameras: CameraBatch, or list of MiniCam sharing the same resolution
+        # invert_bg_color: bool, or a per-camera sequence of bool
+        # return: image [N, 3, H, W], depth/alpha [N, 1, H, W], per-view lists of densification stats
+        if isinstance(invert_bg_color, (bool, np.bool_)):
+            invert_bg_color = [invert_bg_color] * len(cameras)
+
+        results = {key: [] for key in ("image", "depth", "alpha", "viewspace_points", "visibility_filter", "radii")}
+        for cam, invert in zip(cameras, invert_bg_color):
+            out = self.render(cam, scaling_modifier, invert_bg_color=bool(invert))
+            for key in results:
+                results[key].append(out[key])
+
+        for key in ("image", "depth", "alpha"):
+            results[key] = torch.stack(results[key], dim=0)
+
+        return results
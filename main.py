@@ -1,5 +1,6 @@
 import os
 import cv2
+import math
 import time
 import tqdm
 import numpy as np
@@ -11,12 +12,17 @@ import torch.nn.functional as F
 import rembg
 
 from cam_utils import orbit_camera, OrbitCamera
-from gs_renderer import Renderer, MiniCam
+from gs_renderer import Renderer, MiniCam, CameraBatch
 
 from grid_put import mipmap_linear_grid_put_2d
 from mesh import Mesh, safe_normalize
 
+# extra viewport height for the native title bar on windows
+_TITLEBAR_H = 45 if os.name == "nt" else 0
+
 class GUI:
+    _theme_cache = {}  # (component, colors, styles) -> dpg theme, see get_or_create_theme
+
     def __init__(self, opt):
         self.opt = opt  # shared with the trainer's opt to support in-place modification of rendering parameters.
         self.gui = opt.gui # enable gui
@@ -27,8 +33,13 @@ class GUI:
         self.mode = "image"
         self.seed = "random"
 
-        self.buffer_image = np.ones((self.W, self.H, 3), dtype=np.float32)
-        self.need_update = True  # update buffer_image
+        self.buffer_image = np.ones((self.H, self.W, 3), dtype=np.float32)  # backs the raw texture, only ever updated in place (must stay contiguous, else seg fault!)
+        self.host_buffer = None # pinned D2H staging for buffer_image, only needed (and allocated) with the gui
+        # update buffer_image when the dirty epoch is ahead of the rendered one (see need_update)
+        self.dirty_epoch = 1
+        self.render_epoch = 0
+        self.last_state_key = None  # state of the last rendered frame, see test_step
+        self.last_log_values = {}  # last text pushed to each _log_* widget, see set_log
 
         # models
         self.device = torch.device("cuda")
@@ -61,6 +72,7 @@ class GUI:
         self.optimizer = None
         self.step = 0
         self.train_steps = 1  # steps per rendering loop
+        self.last_test_time = 0  # time of the last preview render, to throttle redraws while training
         
         # load input data from cmdline
         if self.opt.input is not None:
@@ -78,6 +90,7 @@ class GUI:
             self.renderer.initialize(num_pts=self.opt.num_pts)
 
         if self.gui:
+            self.host_buffer = torch.empty((self.H, self.W, 3), dtype=torch.float32, pin_memory=True)
             dpg.create_context()
             self.register_dpg()
             self.test_step()
@@ -86,6 +99,20 @@ class GUI:
         if self.gui:
             dpg.destroy_context()
 
+    # dpg runs ui callbacks on its own thread, so a plain flag cleared at the end of test_step
+    # could drop a request made while rendering. requests bump an epoch instead, and test_step
+    # only marks as rendered the epoch it started from.
+    @property
+    def need_update(self):
+        return self.dirty_epoch != self.render_epoch
+
+    @need_update.setter
+    def need_update(self, value):
+        if value:
+            self.dirty_epoch += 1
+        else:
+            self.render_epoch = self.dirty_epoch
+
     def seed_everything(self):
         try:
             seed = int(self.seed)
@@ -96,7 +123,8 @@ class GUI:
         np.random.seed(seed)
         torch.manual_seed(seed)
         torch.cuda.manual_seed(seed)
-        torch.backends.cudnn.deterministic = True
+        # deterministic kernels disable the fastest cudnn algorithms, only use them when asked to
+        torch.backends.cudnn.deterministic = bool(getattr(self.opt, 'deterministic', False))
         torch.backends.cudnn.benchmark = True
 
         self.last_seed = seed
@@ -104,6 +132,9 @@ class GUI:
     def prepare_train(self):
 
         self.step = 0
+        # the model may have been re-initialized, force a re-render
+        self.last_state_key = None
+        self.need_update = True
 
         # setup training
         self.renderer.gaussians.training_setup(self.opt)
@@ -123,6 +154,16 @@ class GUI:
             self.cam.far,
         )
 
+        # pose table for the random-view sampler, indexed by [ver, hor] offsets
+        # avoid too large elevation (> 80 or < -80), and make sure it always cover [-30, 30]
+        min_ver = max(min(-30, -30 - self.opt.elevation), -80 - self.opt.elevation)
+        max_ver = min(max(30, 30 - self.opt.elevation), 80 - self.opt.elevation)
+        self.pose_lut_vers = np.arange(min_ver, max_ver)
+        self.pose_lut_hors = np.arange(-180, 180)
+        vers, hors = np.meshgrid(self.pose_lut_vers, self.pose_lut_hors, indexing='ij')
+        poses = orbit_camera(self.opt.elevation + vers.reshape(-1), hors.reshape(-1), self.opt.radius)
+        self.pose_lut = torch.from_numpy(poses).to(self.device).view(*vers.shape, 4, 4) # [V, H, 4, 4]
+
         self.enable_sd = self.opt.lambda_sd > 0 and self.prompt != ""
         self.enable_zero123 = self.opt.lambda_zero123 > 0 and self.input_img is not None
 
@@ -141,11 +182,16 @@ class GUI:
 
         # input image
         if self.input_img is not None:
-            self.input_img_torch = torch.from_numpy(self.input_img).permute(2, 0, 1).unsqueeze(0).to(self.device)
-            self.input_img_torch = F.interpolate(self.input_img_torch, (self.opt.ref_size, self.opt.ref_size), mode="bilinear", align_corners=False)
+            # upload image and mask together from pinned memory in a single async copy
+            input_rgba = torch.from_numpy(np.concatenate([self.input_img, self.input_mask], axis=-1)).pin_memory()
+            input_rgba = input_rgba.to(self.device, non_blocking=True).permute(2, 0, 1).unsqueeze(0)
+            input_rgba = F.interpolate(input_rgba, (self.opt.ref_size, self.opt.ref_size), mode="bilinear", align_corners=False)
 
-            self.input_mask_torch = torch.from_numpy(self.input_mask).permute(2, 0, 1).unsqueeze(0).to(self.device)
-            self.input_mask_torch = F.interpolate(self.input_mask_torch, (self.opt.ref_size, self.opt.ref_size), mode="bilinear", align_corners=False)
+            self.input_img_torch = input_rgba[:, :3].contiguous()
+            self.input_mask_torch = input_rgba[:, 3:].contiguous()
+
+        # known view loss, specialized once as the input image is fixed for the whole training run
+        self.known_view_loss = self.build_known_view_loss()
 
         # prepare embeddings
         with torch.no_grad():
@@ -157,12 +203,30 @@ class GUI:
                 self.guidance_zero123.get_img_embeds(self.input_img_torch)
 
 
+    def build_known_view_loss(self):
+        # without an input image there is no known view to supervise
+        if self.input_img_torch is None:
+            return lambda step_ratio: 0
+
+        def known_view_loss(step_ratio):
+            out = self.renderer.render(self.fixed_cam)
+
+            # rgb loss
+            image = out["image"].unsqueeze(0) # [1, 3, H, W] in [0, 1]
+            loss = 10000 * step_ratio * F.mse_loss(image, self.input_img_torch)
+
+            # mask loss
+            mask = out["alpha"].unsqueeze(0) # [1, 1, H, W] in [0, 1]
+            loss = loss + 1000 * step_ratio * F.mse_loss(mask, self.input_mask_torch)
+
+            return loss
+
+        return known_view_loss
+
     def get_fatness(self, gaussians, cam_matrix):
-        # Project Gaussian centers to the camera coordinate system
-        projected_centers = torch.matmul(gaussians.get_xyz, cam_matrix[:3, :3].T) + cam_matrix[:3, 3]
-        
-        # Compute the location in the dimension the camera is facing (z-axis in camera coordinate system)
-        z_locations = projected_centers[:, 2]
+        # Compute the location in the dimension the camera is facing (z-axis in camera coordinate system),
+        # only the z row of the projection is needed
+        z_locations = torch.matmul(gaussians.get_xyz, cam_matrix[2, :3]) + cam_matrix[2, 3]
         
         # Compute the standard deviation in this dimension
         std_dev = torch.std(z_locations)
@@ -181,48 +245,35 @@ class GUI:
         max_x = torch.max(transformed_xyzs[:, 0])
         min_y = torch.min(transformed_xyzs[:, 1])
         max_y = torch.max(transformed_xyzs[:, 1])
-        x_linspace = torch.linspace(min_x.item(), max_x.item(), grid_size)
-        y_linspace = torch.linspace(min_y.item(), max_y.item(), grid_size)
-
-        grid_x, grid_y = torch.meshgrid(x_linspace, y_linspace)
-
-        fatness_scores = []
-        total_gaussians = 0
-
-        # Loop through each cell in the grid
-        for i in range(grid_size - 1):
-            for j in range(grid_size - 1):
-                # Define the boundaries of the current cell
-                #x_min, x_max = grid_x[i, j], grid_x[i+1, j]
-                #y_min, y_max = grid_y[i, j], grid_y[i, j+1]
-                x_min, x_max = x_linspace[i], x_linspace[i+1]
-                y_min, y_max = y_linspace[j], y_linspace[j+1]
-
-
-                # Find the Gaussians that fall into the current cell
-                mask = (transformed_xyzs[:, 0] >= x_min) & (transformed_xyzs[:, 0] <= x_max) & \
-                    (transformed_xyzs[:, 1] >= y_min) & (transformed_xyzs[:, 1] <= y_max)
-
-                # Compute the fatness (std deviation) of the z-values of the Gaussians in this cell
-                num_gaussians = mask.sum().item()
-
-                #print(i,j,num_gaussians)
-
-                if num_gaussians > 1:
-                    column_z_values = transformed_xyzs[mask, 2]
-                    column_fatness = torch.std(column_z_values)
-                    fatness_scores.append(column_fatness * num_gaussians)
-                    total_gaussians += num_gaussians
-
-        print("tg",total_gaussians)
-
-        
-
-        # Compute the weighted mean fatness score
-        if fatness_scores:
-            weighted_mean_fatness = torch.sum(torch.stack(fatness_scores)) / total_gaussians
-        else:
-            weighted_mean_fatness = torch.tensor(0.0)
+        # (built from the GPU tensors directly, .item() would force a sync)
+        steps = torch.arange(grid_size, device=xyzs.device) / (grid_size - 1)
+        x_linspace = min_x + (max_x - min_x) * steps
+        y_linspace = min_y + (max_y - min_y) * steps
+
+        # Assign each Gaussian to one of the (grid_size - 1)^2 cells
+        x, y, z = transformed_xyzs.unbind(dim=1)
+        bx = torch.bucketize(x, x_linspace[1:-1])
+        by = torch.bucketize(y, y_linspace[1:-1])
+        cells = bx * (grid_size - 1) + by
+
+        # Accumulate count and sum of the z-values per cell to get each cell's mean
+        num_cells = (grid_size - 1) ** 2
+        stats = torch.stack([torch.ones_like(z), z], dim=1) # [N, 2]
+        stats = torch.zeros(num_cells, 2, device=z.device).index_add(0, cells, stats)
+        counts, sum_z = stats.unbind(dim=1)
+        column_mean = sum_z / counts.clamp_min(1)
+
+        # Then the squared deviations from the cell's own mean, so thin columns don't cancel to zero in float32
+        sq_dev = (z - column_mean[cells]) ** 2
+        sum_sq_dev = torch.zeros(num_cells, device=z.device).index_add(0, cells, sq_dev)
+
+        # Compute the fatness (unbiased std deviation, as torch.std) of the z-values in each cell
+        column_var = sum_sq_dev / (counts - 1).clamp_min(1)
+        column_fatness = column_var.clamp_min(1e-20).sqrt()
+
+        # Compute the weighted mean fatness score, over cells with more than one Gaussian
+        weights = torch.where(counts > 1, counts, torch.zeros_like(counts))
+        weighted_mean_fatness = (column_fatness * weights).sum() / weights.sum().clamp_min(1)
 
         return weighted_mean_fatness
 
@@ -240,58 +291,33 @@ class GUI:
             # update lr
             self.renderer.gaussians.update_learning_rate(self.step)
 
-            loss = 0
-
             ### known view
-            if self.input_img_torch is not None:
-                cur_cam = self.fixed_cam
-                out = self.renderer.render(cur_cam)
-
-                # rgb loss
-                image = out["image"].unsqueeze(0) # [1, 3, H, W] in [0, 1]
-                loss = loss + 10000 * step_ratio * F.mse_loss(image, self.input_img_torch)
-
-                # mask loss
-                mask = out["alpha"].unsqueeze(0) # [1, 1, H, W] in [0, 1]
-                loss = loss + 1000 * step_ratio * F.mse_loss(mask, self.input_mask_torch)
+            loss = self.known_view_loss(step_ratio)
 
             ### novel view (manual batch)
             render_resolution = 128 if step_ratio < 0.3 else (256 if step_ratio < 0.6 else 512)
-            images = []
-            vers, hors, radii = [], [], []
-            # avoid too large elevation (> 80 or < -80), and make sure it always cover [-30, 30]
-            min_ver = max(min(-30, -30 - self.opt.elevation), -80 - self.opt.elevation)
-            max_ver = min(max(30, 30 - self.opt.elevation), 80 - self.opt.elevation)
-            for _ in range(self.opt.batch_size):
-
-                # render random view
-                ver = np.random.randint(min_ver, max_ver)
-                hor = np.random.randint(-180, 180)
-                radius = 0
-
-                vers.append(ver)
-                hors.append(hor)
-                radii.append(radius)
-
-                pose = orbit_camera(self.opt.elevation + ver, hor, self.opt.radius + radius)
-
-                cur_cam = MiniCam(
-                    pose,
-                    render_resolution,
-                    render_resolution,
-                    self.cam.fovy,
-                    self.cam.fovx,
-                    self.cam.near,
-                    self.cam.far,
-                )
-
-                invert_bg_color = np.random.rand() > self.opt.invert_bg_prob
-                out = self.renderer.render(cur_cam, invert_bg_color=invert_bg_color)
-
-                image = out["image"].unsqueeze(0)# [1, 3, H, W] in [0, 1]
-                images.append(image)
-            
-            images = torch.cat(images, dim=0)
+            # sample all random views up-front, poses are looked up from the precomputed table
+            idx_ver = np.random.randint(0, len(self.pose_lut_vers), size=self.opt.batch_size)
+            idx_hor = np.random.randint(0, len(self.pose_lut_hors), size=self.opt.batch_size)
+            vers = self.pose_lut_vers[idx_ver]
+            hors = self.pose_lut_hors[idx_hor]
+            radii = np.zeros(self.opt.batch_size, dtype=np.int64)
+            invert_bg_colors = np.random.rand(self.opt.batch_size) > self.opt.invert_bg_prob
+
+            poses = self.pose_lut[torch.from_numpy(idx_ver), torch.from_numpy(idx_hor)] # [B, 4, 4]
+
+            # render all views in one call
+            cams = CameraBatch(
+                poses,
+                render_resolution,
+                render_resolution,
+                self.cam.fovy,
+                self.cam.fovx,
+                self.cam.near,
+                self.cam.far,
+            )
+            out = self.renderer.render_batch(cams, invert_bg_color=invert_bg_colors)
+            images = out["image"] # [B, 3, H, W] in [0, 1]
 
             # import kiui
             # kiui.lo(hor, ver)
@@ -313,11 +339,12 @@ class GUI:
             # optimize step
             loss.backward()
             self.optimizer.step()
-            self.optimizer.zero_grad()
+            self.optimizer.zero_grad(set_to_none=True)
 
             # densify and prune
             if self.step >= self.opt.density_start_iter and self.step <= self.opt.density_end_iter:
-                viewspace_point_tensor, visibility_filter, radii = out["viewspace_points"], out["visibility_filter"], out["radii"]
+                # stats from the last rendered view
+                viewspace_point_tensor, visibility_filter, radii = out["viewspace_points"][-1], out["visibility_filter"][-1], out["radii"][-1]
                 self.renderer.gaussians.max_radii2D[visibility_filter] = torch.max(self.renderer.gaussians.max_radii2D[visibility_filter], radii[visibility_filter])
                 self.renderer.gaussians.add_densification_stats(viewspace_point_tensor, visibility_filter)
 
@@ -332,11 +359,9 @@ class GUI:
         torch.cuda.synchronize()
         t = starter.elapsed_time(ender)
 
-        self.need_update = True
-
         if self.gui:
-            dpg.set_value("_log_train_time", f"{t:.4f}ms")
-            dpg.set_value(
+            self.set_log("_log_train_time", f"{t:.4f}ms")
+            self.set_log(
                 "_log_train_log",
                 f"step = {self.step: 5d} (+{self.train_steps: 2d}) loss = {loss.item():.4f}, fatness = {fatness_score:.4f}",
             )
@@ -353,13 +378,17 @@ class GUI:
         # ignore if no need to update
         if not self.need_update:
             return
+        epoch = self.dirty_epoch
 
         starter = torch.cuda.Event(enable_timing=True)
         ender = torch.cuda.Event(enable_timing=True)
         starter.record()
 
-        # should update image
-        if self.need_update:
+        # should update image, unless nothing the renderer depends on changed (e.g. only the overlay was toggled)
+        state_key = (self.cam.pose.tobytes(), self.cam.fovy, self.mode, self.gaussain_scale_factor, self.step)
+        # blend weight of the input image, a fully opaque overlay doesn't need a render at all
+        overlay_ratio = self.overlay_input_img_ratio if (self.overlay_input_img and self.input_img is not None) else 0
+        if overlay_ratio < 1 and state_key != self.last_state_key:
             # render image
 
             cur_cam = MiniCam(
@@ -388,34 +417,31 @@ class GUI:
                 align_corners=False,
             ).squeeze(0)
 
-            self.buffer_image = (
-                buffer_image.permute(1, 2, 0)
-                .contiguous()
-                .clamp(0, 1)
-                .contiguous()
-                .detach()
-                .cpu()
-                .numpy()
-            )
-
-            # display input_image
-            if self.overlay_input_img and self.input_img is not None:
-                self.buffer_image = (
-                    self.buffer_image * (1 - self.overlay_input_img_ratio)
-                    + self.input_img * self.overlay_input_img_ratio
-                )
-
-            self.need_update = False
+            # async copy into the pinned host buffer, completed by the synchronize below
+            buffer_image = buffer_image.permute(1, 2, 0).contiguous().clamp_(0, 1)
+            self.host_buffer.copy_(buffer_image, non_blocking=True)
+            self.last_state_key = state_key
 
         ender.record()
         torch.cuda.synchronize()
         t = starter.elapsed_time(ender)
+        self.last_test_time = time.monotonic()
+
+        # write into buffer_image in place, it backs the raw texture so dpg picks it up without set_value
+        # display input_image
+        if overlay_ratio >= 1:
+            np.copyto(self.buffer_image, self.input_img)
+        elif overlay_ratio > 1e-4:
+            np.multiply(self.host_buffer.numpy(), 1 - overlay_ratio, out=self.buffer_image)
+            self.buffer_image += self.input_img * overlay_ratio
+        else:
+            np.copyto(self.buffer_image, self.host_buffer.numpy())
+
+        # requests made during this render keep need_update set for the next frame
+        self.render_epoch = epoch
 
         if self.gui:
-            dpg.set_value("_log_infer_time", f"{t:.4f}ms ({int(1000/t)} FPS)")
-            dpg.set_value(
-                "_texture", self.buffer_image
-            )  # buffer must be contiguous, else seg fault!
+            self.set_log("_log_infer_time", f"{t:.4f}ms ({int(1000/max(t, 1e-3))} FPS)")  # t can be ~0 when the render is skipped
 
     
     def load_input(self, file):
@@ -427,14 +453,16 @@ class GUI:
                 self.bg_remover = rembg.new_session()
             img = rembg.remove(img, session=self.bg_remover)
 
-        img = cv2.resize(img, (self.W, self.H), interpolation=cv2.INTER_AREA)
-        img = img.astype(np.float32) / 255.0
+        # resize on gpu, antialiased to match cv2.INTER_AREA quality when downsampling
+        img = torch.from_numpy(img).to(self.device).permute(2, 0, 1).unsqueeze(0).float() / 255.0
+        img = F.interpolate(img, (self.H, self.W), mode="bilinear", align_corners=False, antialias=True)[0] # [4, H, W]
+
+        mask = img[3:]
+        # white bg, with bgr to rgb fused into the channel indexing
+        rgb = img[[2, 1, 0]] * mask + (1 - mask)
 
-        self.input_mask = img[..., 3:]
-        # white bg
-        self.input_img = img[..., :3] * self.input_mask + (1 - self.input_mask)
-        # bgr to rgb
-        self.input_img = self.input_img[..., ::-1].copy()
+        self.input_mask = mask.permute(1, 2, 0).contiguous().cpu().numpy()
+        self.input_img = rgb.permute(1, 2, 0).contiguous().cpu().numpy()
 
         # load prompt
         file_prompt = file.replace("_rgba.png", "_caption.txt")
@@ -585,6 +613,27 @@ class GUI:
 
         print(f"[INFO] save model to {path}.")
 
+    def set_log(self, tag, value):
+        # only push log text to dpg when it actually changed
+        if self.last_log_values.get(tag) != value:
+            dpg.set_value(tag, value)
+            self.last_log_values[tag] = value
+
+    def get_or_create_theme(self, component, colors=(), styles=()):
+        # colors: ((target, (r, g, b)), ...), styles: ((target, x[, y]), ...)
+        # themes are cached by their settings, so re-registering the gui reuses the existing items
+        key = (component, colors, styles)
+        theme = GUI._theme_cache.get(key)
+        if theme is None or not dpg.does_item_exist(theme):
+            with dpg.theme() as theme:
+                with dpg.theme_component(component):
+                    for target, value in colors:
+                        dpg.add_theme_color(target, value, category=dpg.mvThemeCat_Core)
+                    for target, *values in styles:
+                        dpg.add_theme_style(target, *values, category=dpg.mvThemeCat_Core)
+            GUI._theme_cache[key] = theme
+        return theme
+
     def register_dpg(self):
         ### register texture
 
@@ -625,22 +674,24 @@ class GUI:
             no_title_bar=True,
         ):
             # button theme
-            with dpg.theme() as theme_button:
-                with dpg.theme_component(dpg.mvButton):
-                    dpg.add_theme_color(dpg.mvThemeCol_Button, (23, 3, 18))
-                    dpg.add_theme_color(dpg.mvThemeCol_ButtonHovered, (51, 3, 47))
-                    dpg.add_theme_color(dpg.mvThemeCol_ButtonActive, (83, 18, 83))
-                    dpg.add_theme_style(dpg.mvStyleVar_FrameRounding, 5)
-                    dpg.add_theme_style(dpg.mvStyleVar_FramePadding, 3, 3)
+            theme_button = self.get_or_create_theme(
+                dpg.mvButton,
+                colors=(
+                    (dpg.mvThemeCol_Button, (23, 3, 18)),
+                    (dpg.mvThemeCol_ButtonHovered, (51, 3, 47)),
+                    (dpg.mvThemeCol_ButtonActive, (83, 18, 83)),
+                ),
+                styles=(
+                    (dpg.mvStyleVar_FrameRounding, 5),
+                    (dpg.mvStyleVar_FramePadding, 3, 3),
+                ),
+            )
 
             # timer stuff
             with dpg.group(horizontal=True):
                 dpg.add_text("Infer time: ")
                 dpg.add_text("no data", tag="_log_infer_time")
 
-            def callback_setattr(sender, app_data, user_data):
-                setattr(self, user_data, app_data)
-
             # init stuff
             with dpg.collapsing_header(label="Initialize", default_open=True):
 
@@ -660,26 +711,31 @@ class GUI:
                 def callback_select_input(sender, app_data):
                     # only one item
                     for k, v in app_data["selections"].items():
-                        dpg.set_value("_log_input", k)
+                        self.set_log("_log_input", k)
                         self.load_input(v)
 
                     self.need_update = True
 
-                with dpg.file_dialog(
-                    directory_selector=False,
-                    show=False,
-                    callback=callback_select_input,
-                    file_count=1,
-                    tag="file_dialog_tag",
-                    width=700,
-                    height=400,
-                ):
-                    dpg.add_file_extension("Images{.jpg,.jpeg,.png}")
+                def callback_show_file_dialog(sender, app_data):
+                    # the file dialog is only built the first time it is needed
+                    if not dpg.does_item_exist("file_dialog_tag"):
+                        with dpg.file_dialog(
+                            directory_selector=False,
+                            show=False,
+                            callback=callback_select_input,
+                            file_count=1,
+                            tag="file_dialog_tag",
+                            width=700,
+                            height=400,
+                        ):
+                            dpg.add_file_extension("Images{.jpg,.jpeg,.png}")
+
+                    dpg.show_item("file_dialog_tag")
 
                 with dpg.group(horizontal=True):
                     dpg.add_button(
                         label="input",
-                        callback=lambda: dpg.show_item("file_dialog_tag"),
+                        callback=callback_show_file_dialog,
                     )
                     dpg.add_text("", tag="_log_input")
                 
@@ -711,26 +767,33 @@ class GUI:
 
                 # prompt stuff
             
+                def callback_set_prompt(sender, app_data):
+                    self.prompt = app_data
+
                 dpg.add_input_text(
                     label="prompt",
                     default_value=self.prompt,
-                    callback=callback_setattr,
-                    user_data="prompt",
+                    callback=callback_set_prompt,
                 )
 
+                def callback_set_negative_prompt(sender, app_data):
+                    self.negative_prompt = app_data
+
                 dpg.add_input_text(
                     label="negative",
                     default_value=self.negative_prompt,
-                    callback=callback_setattr,
-                    user_data="negative_prompt",
+                    callback=callback_set_negative_prompt,
                 )
 
                 #fatness inputs
-                def callback_set_opt_attr(sender, app_data, user_data):
-                    setattr(self.opt, user_data, app_data)
+                def callback_set_lambda_fatness(sender, app_data):
+                    self.opt.lambda_fatness = app_data
 
-                dpg.add_input_float(label="lambda_fatness", default_value=self.opt.lambda_fatness, callback=callback_set_opt_attr, user_data="lambda_fatness")
-                dpg.add_input_float(label="ideal_fatness", default_value=self.opt.ideal_fatness, callback=callback_set_opt_attr, user_data="ideal_fatness")
+                def callback_set_ideal_fatness(sender, app_data):
+                    self.opt.ideal_fatness = app_data
+
+                dpg.add_input_float(label="lambda_fatness", default_value=self.opt.lambda_fatness, callback=callback_set_lambda_fatness)
+                dpg.add_input_float(label="ideal_fatness", default_value=self.opt.ideal_fatness, callback=callback_set_ideal_fatness)
 
 
                 # save current model
@@ -764,11 +827,13 @@ class GUI:
                     )
                     dpg.bind_item_theme("_button_save_mesh_with_tex", theme_button)
 
+                    def callback_set_save_path(sender, app_data):
+                        self.opt.save_path = app_data
+
                     dpg.add_input_text(
                         label="",
                         default_value=self.opt.save_path,
-                        callback=callback_setattr,
-                        user_data="save_path",
+                        callback=callback_set_save_path,
                     )
 
             # training stuff
@@ -780,6 +845,8 @@ class GUI:
                     def callback_train(sender, app_data):
                         if self.training:
                             self.training = False
+                            # the preview is throttled while training, show the last steps
+                            self.need_update = True
                             dpg.configure_item("_button_train", label="start")
                         else:
                             self.prepare_train()
@@ -797,6 +864,12 @@ class GUI:
 
                     #restart 
                     def callback_restart(sender, app_data):
+                        # drop the old optimizer first, it holds the previous params and their adam
+                        # moments, which would otherwise stay alive while the new ones are allocated.
+                        # only safe while stopped: train_step runs on the main loop and needs a valid optimizer
+                        if not self.training:
+                            self.renderer.gaussians.optimizer = None
+                            self.optimizer = None
                         self.renderer.initialize(num_pts=self.opt.num_pts)
                         self.prepare_train()
                         self.training = False
@@ -808,6 +881,17 @@ class GUI:
 
                     dpg.bind_item_theme("_button_train", theme_button)
 
+                def callback_set_train_steps(sender, app_data):
+                    self.train_steps = app_data
+
+                dpg.add_slider_int(
+                    label="steps per frame",
+                    min_value=1,
+                    max_value=16,
+                    default_value=self.train_steps,
+                    callback=callback_set_train_steps,
+                )
+
                 with dpg.group(horizontal=True):
                     dpg.add_text("", tag="_log_train_time")
                     dpg.add_text("", tag="_log_train_log")
@@ -828,7 +912,7 @@ class GUI:
 
                 # fov slider
                 def callback_set_fovy(sender, app_data):
-                    self.cam.fovy = np.deg2rad(app_data)
+                    self.cam.fovy = math.radians(app_data)
                     self.need_update = True
 
                 dpg.add_slider_int(
@@ -836,7 +920,7 @@ class GUI:
                     min_value=1,
                     max_value=120,
                     format="%d deg",
-                    default_value=np.rad2deg(self.cam.fovy),
+                    default_value=math.degrees(self.cam.fovy),
                     callback=callback_set_fovy,
                 )
 
@@ -855,41 +939,41 @@ class GUI:
 
         ### register camera handler
 
-        def callback_camera_drag_rotate_or_draw_mask(sender, app_data):
-            if not dpg.is_item_focused("_primary_window"):
-                return
+        # drag/wheel events can only go to a global handler_registry (item handler
+        # registries don't take them), so the focus test lives in one place
+        def primary_window_only(callback):
+            def wrapper(sender, app_data):
+                if dpg.is_item_focused("_primary_window"):
+                    callback(sender, app_data)
+            return wrapper
 
+        @primary_window_only
+        def callback_camera_drag_rotate_or_draw_mask(sender, app_data):
             dx = app_data[1]
             dy = app_data[2]
 
             self.cam.orbit(dx, dy)
             self.need_update = True
 
+        @primary_window_only
         def callback_camera_wheel_scale(sender, app_data):
-            if not dpg.is_item_focused("_primary_window"):
-                return
-
             delta = app_data
 
             self.cam.scale(delta)
             self.need_update = True
 
+        @primary_window_only
         def callback_camera_drag_pan(sender, app_data):
-            if not dpg.is_item_focused("_primary_window"):
-                return
-
             dx = app_data[1]
             dy = app_data[2]
 
             self.cam.pan(dx, dy)
             self.need_update = True
 
+        @primary_window_only
         def callback_set_mouse_loc(sender, app_data):
-            if not dpg.is_item_focused("_primary_window"):
-                return
-
             # just the pixel coordinate in image
-            self.mouse_loc = np.array(app_data)
+            self.mouse_loc = (app_data[0], app_data[1])
 
         with dpg.handler_registry():
             # for camera moving
@@ -905,23 +989,20 @@ class GUI:
         dpg.create_viewport(
             title="Gaussian3D",
             width=self.W + 600,
-            height=self.H + (45 if os.name == "nt" else 0),
+            height=self.H + _TITLEBAR_H,
             resizable=False,
         )
 
         ### global theme
-        with dpg.theme() as theme_no_padding:
-            with dpg.theme_component(dpg.mvAll):
-                # set all padding to 0 to avoid scroll bar
-                dpg.add_theme_style(
-                    dpg.mvStyleVar_WindowPadding, 0, 0, category=dpg.mvThemeCat_Core
-                )
-                dpg.add_theme_style(
-                    dpg.mvStyleVar_FramePadding, 0, 0, category=dpg.mvThemeCat_Core
-                )
-                dpg.add_theme_style(
-                    dpg.mvStyleVar_CellPadding, 0, 0, category=dpg.mvThemeCat_Core
-                )
+        # set all padding to 0 to avoid scroll bar
+        theme_no_padding = self.get_or_create_theme(
+            dpg.mvAll,
+            styles=(
+                (dpg.mvStyleVar_WindowPadding, 0, 0),
+                (dpg.mvStyleVar_FramePadding, 0, 0),
+                (dpg.mvStyleVar_CellPadding, 0, 0),
+            ),
+        )
 
         dpg.bind_item_theme("_primary_window", theme_no_padding)
 
@@ -940,18 +1021,25 @@ class GUI:
 
     def render(self):
         assert self.gui
-        while dpg.is_dearpygui_running():
+        # bind the per-frame dpg calls once, outside the hot loop
+        is_running = dpg.is_dearpygui_running
+        render_frame = dpg.render_dearpygui_frame
+        while is_running():
             # update texture every frame
             if self.training:
                 self.train_step()
+                # refresh the training preview at most 30 times per second, ui changes still redraw immediately
+                if time.monotonic() - self.last_test_time > 1 / 30:
+                    self.need_update = True
             self.test_step()
-            dpg.render_dearpygui_frame()
+            render_frame()
     
     # no gui mode
     def train(self, iters=500):
         if iters > 0:
             self.prepare_train()
-            for i in tqdm.trange(iters):
+            # cap progress bar refreshes to twice per second regardless of the iteration rate
+            for i in tqdm.trange(iters, mininterval=0.5, miniters=max(1, iters // 100)):
                 self.train_step()
             # do a last prune
             self.renderer.gaussians.prune(min_opacity=0.01, extent=1, max_screen_size=1)
@@ -3,6 +3,7 @@ import glob
 import sys
 import cv2
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import matplotlib.pyplot as plt
 
@@ -39,6 +40,7 @@ if __name__ == '__main__':
     parser.add_argument('--size', default=256, type=int, help="output resolution")
     parser.add_argument('--border_ratio', default=0.2, type=float, help="output border ratio")
     parser.add_argument('--recenter', type=bool, default=True, help="recenter, potentially not helpful for multiview zero123")    
+    parser.add_argument('--workers', default=2, type=int, help="images processed concurrently (onnxruntime already uses all cores per image)")
     opt = parser.parse_args()
 
     session = rembg.new_session(model_name=opt.model)
@@ -51,7 +53,7 @@ if __name__ == '__main__':
         files = [opt.path]
         out_dir = os.path.dirname(opt.path)
     
-    for file in files:
+    def process(file):
 
         out_base = os.path.basename(file).split('.')[0]
         out_rgba = os.path.join(out_dir, out_base + '_rgba.png')
@@ -61,13 +63,13 @@ if __name__ == '__main__':
         image = cv2.imread(file, cv2.IMREAD_UNCHANGED)
         
         # carve background
-        print(f'[INFO] background removal...')
+        print(f'[INFO] background removal {file}...')
         carved_image = rembg.remove(image, session=session) # [H, W, 4]
         mask = carved_image[..., -1] > 0
 
         # recenter
         if opt.recenter:
-            print(f'[INFO] recenter...')
+            print(f'[INFO] recenter {file}...')
             final_rgba = np.zeros((opt.size, opt.size, 4), dtype=np.uint8)
             
             coords = np.nonzero(mask)
@@ -89,4 +91,11 @@ if __name__ == '__main__':
             final_rgba = carved_image
         
         # write image
-        cv2.imwrite(out_rgba, final_rgba)
\ No newline at end of file
+        cv2.imwrite(out_rgba, final_rgba)
+        print(f'[INFO] saved {out_rgba}')
+
+    # onnxruntime releases the GIL during inference, so images can share the session across threads.
+    # its intra-op pool already spans every core, so only a few workers are needed to overlap file io
+    # and resizing with inference, more would just oversubscribe the cpu
+    with ThreadPoolExecutor(max_workers=max(1, min(len(files), opt.workers))) as executor:
+        list(executor.map(process, files))